@@ -1,46 +1,16 @@
-from twisted.internet import reactor, defer
-from twisted.internet.endpoints import TCP4ClientEndpoint, TCP4ServerEndpoint
+import argparse
 
-from duPontCollimator import config, tcsDevice, m2Device, duPontCollimator
+from duPontCollimator import config
 
-tcsDev = None
-m2Dev = None
+parser = argparse.ArgumentParser(description="Run the du Pont collimator")
+parser.add_argument("--runtime", choices=["twisted", "asyncio"], default="twisted",
+    help="event loop to run on (default twisted)")
+args = parser.parse_args()
 
-def tcsConnected(protocol):
-    # called when connected
-    global tcsDev
-    tcsDev = protocol # a TCSDevice
+# import only the requested runtime
+if args.runtime == "asyncio":
+    from duPontCollimator import asyncioRuntime as runtime
+else:
+    from duPontCollimator import twistedRuntime as runtime
 
-def m2Connected(protocol):
-    # called when connected
-    global m2Dev
-    m2Dev = protocol # a M2Device
-
-def bothConnected(result):
-    for (success, value) in result:
-        if not success:
-            print("Connection failure: %s"%value.getErrorMessage())
-            reactor.stop()
-            break
-    else:
-        print("Both connections ok...starting server")
-        endpoint = TCP4ServerEndpoint(reactor, config.userPort)
-        Factory = duPontCollimator.getFactory(tcsDev, m2Dev)
-        endpoint.listen(Factory())
-
-# begin connection to tcs
-point = TCP4ClientEndpoint(reactor, config.tcsHost, config.tcsPort)
-dTCS = point.connect(tcsDevice.TCSFact())
-dTCS.addCallback(tcsConnected)
-
-# begin connection to M2
-point = TCP4ClientEndpoint(reactor, config.m2Host, config.m2Port)
-dM2 = point.connect(m2Device.M2Fact())
-dM2.addCallback(m2Connected)
-
-# when both are connected
-# construct the server
-dl = defer.DeferredList([dM2, dTCS])
-dl.addCallback(bothConnected)
-
-reactor.run()
\ No newline at end of file
+runtime.run(config.instances)
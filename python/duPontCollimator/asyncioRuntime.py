@@ -0,0 +1,168 @@
+from __future__ import division, absolute_import
+
+import asyncio
+import traceback
+import sys
+
+from . import config
+from .baseDevice import maxLineLength
+from .tcsDevice import TCSDevice
+from .m2Device import M2Device
+from .duPontCollimator import DuPontCollimator
+
+
+class LoopingCall(object):
+    """Call func every interval seconds on the running event loop,
+    behaves like twisted's task.LoopingCall
+    """
+    def __init__(self, func):
+        self.func = func
+        self.interval = None
+        self.running = False
+        self._handle = None
+
+    def start(self, interval, now=True):
+        assert not self.running, "Tried to start an already running LoopingCall."
+        self.interval = interval
+        self.running = True
+        if now:
+            self._call()
+        else:
+            self._handle = asyncio.get_running_loop().call_later(interval, self._call)
+
+    def stop(self):
+        assert self.running, "Tried to stop a LoopingCall that was not running."
+        self.running = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _call(self):
+        # schedule the next call first, so func may stop the loop
+        self._handle = asyncio.get_running_loop().call_later(self.interval, self._call)
+        try:
+            self.func()
+        except Exception:
+            # like twisted, stop looping on an error
+            traceback.print_exc(file=sys.stdout)
+            self.stop()
+
+
+class AsyncioTransport(asyncio.Protocol):
+    """Connect a device (see baseDevice) to an asyncio connection
+    """
+    def __init__(self, device):
+        self.device = device
+        self.transport = None
+        self._buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.device.connectionMade(self)
+
+    def connection_lost(self, exc):
+        self.device.connectionLost()
+
+    def data_received(self, data):
+        # pass complete lines on, keep the remainder for the next read
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            if self.transport.is_closing():
+                return
+            self.device.dataReceived(line.decode("utf-8", "replace"))
+        if len(self._buffer) > maxLineLength:
+            print("Line longer than %i bytes, dropping connection"%maxLineLength)
+            self.transport.close()
+
+    def write(self, string):
+        self.transport.write(string.encode("utf-8"))
+
+    def loopingCall(self, func):
+        return LoopingCall(func)
+
+
+class InstanceHandle(object):
+    """A started instance: its user server, its tcs and m2
+    connections and any connected users
+    """
+    def __init__(self, instance, m2Transport, tcsTransport):
+        self.instance = instance
+        self.m2Transport = m2Transport
+        self.tcsTransport = tcsTransport
+        self.server = None
+        self.userProtocols = set()
+
+    def buildUserProtocol(self):
+        # forget users that have disconnected
+        self.userProtocols = set(
+            protocol for protocol in self.userProtocols
+            if protocol.transport is None or not protocol.transport.is_closing()
+        )
+        protocol = AsyncioTransport(DuPontCollimator(self.tcsTransport.device, self.m2Transport.device))
+        self.userProtocols.add(protocol)
+        return protocol
+
+    def close(self):
+        """Stop serving users and close all connections of this instance,
+        their status polling and autofocus timers stop with them
+        """
+        if self.server is not None:
+            self.server.close()
+        for protocol in [self.m2Transport, self.tcsTransport] + list(self.userProtocols):
+            if protocol.transport is not None and not protocol.transport.is_closing():
+                protocol.transport.close()
+        self.userProtocols.clear()
+
+
+async def startInstance(instance):
+    """Connect to the tcs and m2 of instance and start its user server,
+    return an InstanceHandle or None if the instance failed to start
+    """
+    loop = asyncio.get_running_loop()
+    result = await asyncio.gather(
+        loop.create_connection(lambda: AsyncioTransport(M2Device()), instance.m2Host, instance.m2Port),
+        loop.create_connection(lambda: AsyncioTransport(TCSDevice()), instance.tcsHost, instance.tcsPort),
+        return_exceptions=True,
+    )
+    failures = [value for value in result if isinstance(value, Exception)]
+    if failures:
+        for failure in failures:
+            print("%s connection failure: %s"%(instance.name, failure))
+        # drop the connection that did succeed
+        for value in result:
+            if not isinstance(value, Exception):
+                value[0].close()
+        return None
+    print("%s: both connections ok...starting server on port %i"%(instance.name, instance.userPort))
+    handle = InstanceHandle(instance, result[0][1], result[1][1])
+    try:
+        handle.server = await loop.create_server(handle.buildUserProtocol, port=instance.userPort)
+    except OSError as e:
+        print("%s could not listen on port %i: %s"%(instance.name, instance.userPort, e))
+        handle.close()
+        return None
+    return handle
+
+async def start(instances=config.instances):
+    """Start all instances in the running event loop,
+    return the list of InstanceHandles started
+    """
+    config.checkInstances(instances)
+    handles = await asyncio.gather(*[startInstance(inst) for inst in instances])
+    handles = [handle for handle in handles if handle is not None]
+    if not handles:
+        raise RuntimeError("No instances started")
+    return handles
+
+def run(instances=config.instances):
+    """Start all instances and run an event loop forever
+    """
+    async def main():
+        handles = await start(instances)
+        try:
+            await asyncio.gather(*[handle.server.serve_forever() for handle in handles])
+        finally:
+            for handle in handles:
+                handle.close()
+    asyncio.run(main())
@@ -1,36 +1,39 @@
 from __future__ import division, absolute_import
 
-from twisted.internet.protocol import Protocol, ClientFactory
-
-#http://twistedmatrix.com/documents/12.1.0/core/howto/clients.html
-
-class BaseDevice(Protocol):
+# protocol logic is kept independent of the transport.
+# a runtime (twistedRuntime or asyncioRuntime) wraps each
+# device in its own protocol class, which calls connectionMade,
+# dataReceived and connectionLost and is handed to the device
+# as its transport.  The protocol class splits the incoming
+# bytes on newlines and passes each complete line, decoded
+# to a str (without the newline), to dataReceived.  Lines
+# longer than maxLineLength drop the connection.
+# A transport must provide:
+#   write(string) -- write a str to the connection
+#   loopingCall(func) -- return an object with start(interval, now=True),
+#       stop() and running, behaving like twisted's task.LoopingCall
+
+maxLineLength = 65536 # bytes
+
+class BaseDevice(object):
+
+    def __init__(self):
+        self.transport = None
 
     def dataReceived(self, data):
-        # this is called everytime a line of data
-        # is received from the device
+        # this is called with each line of data
+        # (decoded to a str) received from the device
         raise NotImplementedError("subclasses must override")
 
-    def connectionMade(self):
+    def connectionMade(self, transport):
         # this is called when the connection is established
+        self.transport = transport
         print("Connection Made")
 
+    def connectionLost(self):
+        # this is called when the connection is closed
+        pass
+
     def writeToDevice(self, devString):
         # write a string to the device
         self.transport.write(devString)
-
-
-class DeviceClientFactory(ClientFactory):
-    def startedConnecting(self, connector):
-        print('%s started to connect.'%self)
-
-    def buildProtocol(self, addr):
-        # print('%s connected.'%self)
-        #return BaseDeviceProtocol()
-        raise NotImplementedError("subclasses must override, returns a Protocol instance")
-
-    def clientConnectionLost(self, connector, reason):
-        print('%s cost connection.  Reason:' %self, reason)
-
-    def clientConnectionFailed(self, connector, reason):
-        print('%s connection failed. Reason:' %self, reason)
@@ -15,6 +15,28 @@ focusInterval = 5 # seconds
 focusPerDegC = 70 # um per degree C
 focusPerDegElevation = 0 # um per degree elevation
 
+# each instance is an independent tcs/m2/collimator set
+# served from one reactor, each instance listens on its own userPort.
+# all instances share the collimation and focus models below.
+Instance = collections.namedtuple("Instance",
+    ["name", "tcsHost", "tcsPort", "m2Host", "m2Port", "userPort"]
+)
+
+instances = [
+    Instance("duPont", tcsHost, tcsPort, m2Host, m2Port, userPort),
+    # eg a simulator running alongside the telescope:
+    # Instance("sim", "localhost", 4243, "localhost", 52002, 5100),
+]
+
+def checkInstances(instances):
+    # every instance needs a unique name and user port
+    names = [inst.name for inst in instances]
+    userPorts = [inst.userPort for inst in instances]
+    if len(set(names)) != len(names):
+        raise RuntimeError("Duplicate instance names in config: %s"%names)
+    if len(set(userPorts)) != len(userPorts):
+        raise RuntimeError("Duplicate user ports in config: %s"%userPorts)
+
 baseOrientation = collections.OrderedDict((
     ("tip", 45.),
     ("tilt", 6.),
@@ -1,17 +1,34 @@
 from __future__ import division, absolute_import
 
 import collections
+import json
+import sys
+import time
+import traceback
 
 import numpy
 
-from twisted.internet.protocol import Protocol, Factory
-from twisted.internet import task
-
+from .baseDevice import BaseDevice
 from .config import focusInterval, getCollimation, minTranslation, minTipTilt, minFocusMove, getFocus
 
+try:
+    basestring
+except NameError:
+    # python 3
+    basestring = str
+
 ON = "on"
 OFF = "off"
 
+# json protocol error codes
+OK = 0
+BadJSON = 1
+BadCommand = 2
+NotAllowed = 3
+NotReady = 4
+MissingData = 5
+InternalError = 6
+
 helpString ="""
 Commands:
 
@@ -36,17 +53,44 @@ collimate [force] [target]
 --for input RA and Dec coords, else collimate to current telescope
 --position. If force specified, move the mirror even if move is below
 --minimum offset threshold.
+
+json
+--Switch this connection to the json-lines protocol. Each request line is
+--either {"id": <any>, "cmd": "<command>"} or a list of such objects to
+--run several commands in one round trip. Each request line gets exactly
+--one response line: an object (or list of objects, in order) like
+--{"id": <id>, "code": <int>, "messages": [...], "data": {...}, "time": <unix time>}.
+--"status" responses carry numeric values with the unix time each was last received.
+--Collimation values are null (with code 5) while tcs or M2 data are missing.
+--"collimate" and "focus" responses carry the new values, the offsets and
+--"moved" (true only if a move was sent to M2) as numbers.
+--"messages" are for humans only, numeric values are only in "data".
+--Response codes:
+--0: ok (a request may be ok without moving, check "moved")
+--1: bad json, the line or request could not be decoded
+--2: bad command or argument
+--3: not allowed (eg target HA > 5 hours)
+--4: M2 not ready to move
+--5: missing data (no focus baseline, or no tcs or M2 data)
+--6: internal error running the command
+--Unsolicited output (eg autofocus) is sent with "id": null.
+--Send {"cmd": "text"} to switch back to the text protocol.
 """
 
 
-class DuPontCollimator(Protocol):
+class DuPontCollimator(BaseDevice):
     def __init__(self, tcsDevice, m2Device):
+        BaseDevice.__init__(self)
         self.tcsDevice = tcsDevice
         self.m2Device = m2Device
         self.focusBase = None
         self.tempBase = None
         self.autofocus = OFF
-        self.focusTimer = task.LoopingCall(self.updateFocus)
+        self.focusTimer = None # created by connectionMade
+        self.jsonMode = False
+        self.jsonMessages = None # collects replies while a json request runs
+        self.jsonData = None # collects numeric results while a json request runs
+        self.jsonCode = OK
 
     def getTargetCollimationUpdate(self):
         return getCollimation(self.tcsDevice.targetHA, self.tcsDevice.targetDec)
@@ -54,6 +98,21 @@ class DuPontCollimator(Protocol):
     def getCurrentCollimationUpdate(self):
         return getCollimation(self.tcsDevice.ha, self.tcsDevice.dec)
 
+    @property
+    def textMode(self):
+        # False while json output is collected, numeric results
+        # then go in the response data rather than in strings
+        return self.jsonMessages is None and not self.jsonMode
+
+    def hasTargetPosition(self):
+        return None not in [self.tcsDevice.targetHA, self.tcsDevice.targetDec]
+
+    def hasCurrentPosition(self):
+        return None not in [self.tcsDevice.ha, self.tcsDevice.dec]
+
+    def hasOrientation(self):
+        return None not in self.m2Device.orientation
+
     def getCurrentCollimation(self):
         return collections.OrderedDict((
             ("tip", self.m2Device.orientation[1]),
@@ -64,24 +123,128 @@ class DuPontCollimator(Protocol):
 
     def getDeltaCollimation(self, collimation):
         deltaCol = collections.OrderedDict()
-        for key, currValue in self.getCurrentCollimation().iteritems():
+        for key, currValue in self.getCurrentCollimation().items():
             deltaCol[key] = currValue-collimation[key]
         return deltaCol
 
-    def connectionMade(self):
+    def connectionMade(self, transport):
+        self.transport = transport
+        self.focusTimer = transport.loopingCall(self.timedFocus)
         self.reply("HOLA!")
 
-    def connectionLost(self, reason):
-        pass
+    def connectionLost(self):
+        if self.focusTimer is not None and self.focusTimer.running:
+            self.focusTimer.stop()
 
     def dataReceived(self, userInput):
         # parse the incomming command
-        self.parseCommand(userInput)
+        if self.jsonMode:
+            self.parseJSON(userInput)
+        else:
+            self.parseCommand(userInput)
 
-    def reply(self, replyToUser):
+    def reply(self, replyToUser, code=OK):
         # send a string back to the user
-        replyToUser = replyToUser.strip() + "\n"
-        self.transport.write(replyToUser)
+        # code is only reported in json mode
+        replyToUser = replyToUser.strip()
+        if self.jsonMessages is not None:
+            # collect replies for the json request being handled
+            self.jsonMessages.append(replyToUser)
+            if code != OK:
+                self.jsonCode = code
+        elif self.jsonMode:
+            # unsolicited output (eg autofocus timer) in json mode
+            self.writeJSON(self.jsonResponse(None, code, [replyToUser]))
+        else:
+            self.transport.write(replyToUser + "\n")
+
+    def badInput(self, replyToUser):
+        # report bad user input, help is only useful to humans
+        self.reply(replyToUser, BadCommand)
+        if self.jsonMessages is None:
+            self.reply(helpString)
+
+    def setData(self, key, value):
+        # record a numeric result for the json request being handled
+        if self.jsonData is not None:
+            self.jsonData[key] = value
+
+    def writeJSON(self, response):
+        self.transport.write(json.dumps(response) + "\n")
+
+    def jsonResponse(self, reqID, code, messages, data=None):
+        return collections.OrderedDict((
+            ("id", reqID),
+            ("code", code),
+            ("messages", messages),
+            ("data", data),
+            ("time", time.time()),
+        ))
+
+    def parseJSON(self, userInput):
+        # each line is a request object or a list of request objects
+        for line in userInput.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self.writeJSON(self.jsonResponse(None, BadJSON, ["Could not decode json: %s"%line]))
+                continue
+            if isinstance(request, list):
+                self.writeJSON([self.runJSONCommand(req) for req in request])
+            else:
+                self.writeJSON(self.runJSONCommand(request))
+
+    def runJSONCommand(self, request):
+        # run a single json request through the text command
+        # parser, collecting replies, return the response
+        if not isinstance(request, dict):
+            return self.jsonResponse(None, BadJSON, ['Request must be an object with a "cmd" string'])
+        if not isinstance(request.get("cmd"), basestring):
+            return self.jsonResponse(request.get("id"), BadJSON, ['Request must be an object with a "cmd" string'])
+        cmd = request["cmd"].lower().strip()
+        return self.collectJSON(request.get("id"), cmd, self.runCommand, cmd)
+
+    def runCommand(self, cmd):
+        # run a command on behalf of a json request
+        if cmd == "status":
+            self.jsonData.update(self.statusDict())
+            if None in list(self.jsonData["deltaCollimation"].values()):
+                self.reply("Collimation unavailable, missing tcs or M2 data", MissingData)
+        elif cmd == "text":
+            self.jsonMode = False
+            self.reply("Text mode on")
+        else:
+            self.parseCommand(cmd)
+
+    def collectJSON(self, reqID, cmd, func, *args):
+        # call func collecting its replies and numeric
+        # results, return them as a json response
+        self.jsonMessages = []
+        self.jsonData = collections.OrderedDict()
+        self.jsonCode = OK
+        try:
+            func(*args)
+        except Exception as e:
+            self.jsonCode = InternalError
+            self.jsonMessages.append("Error running %s: %s"%(cmd, str(e)))
+            traceback.print_exc(file=sys.stdout)
+        response = self.jsonResponse(reqID, self.jsonCode, self.jsonMessages, self.jsonData or None)
+        self.jsonMessages = None
+        self.jsonData = None
+        return response
+
+    def timedFocus(self):
+        # called by the focus timer, in json mode send
+        # the results as one unsolicited response
+        if not self.jsonMode:
+            self.updateFocus()
+            return
+        response = self.collectJSON(None, "focus", self.updateFocus)
+        if response["messages"]:
+            self.writeJSON(response)
 
     def parseCommand(self, userInput):
         # parse an incomming user command
@@ -93,6 +256,9 @@ class DuPontCollimator(Protocol):
         elif userInput == "status":
             for line in self.statusLines():
                 self.reply(line)
+        elif userInput == "json":
+            self.jsonMode = True
+            self.reply("JSON mode on")
         elif userInput.startswith("collimate"):
             doForce = False
             doTarget = False
@@ -105,8 +271,7 @@ class DuPontCollimator(Protocol):
                 elif arg == "target":
                     doTarget = True
                 else:
-                    self.reply("Bad User Input: %s"%arg)
-                    self.reply(helpString)
+                    self.badInput("Bad User Input: %s"%arg)
                     return
             self.updateCollimation(force=doForce, target=doTarget)
         elif userInput.startswith("focus"):
@@ -115,8 +280,7 @@ class DuPontCollimator(Protocol):
             force = False
             args = userInput.split()
             if OFF in args and (ON in args or "force" in args):
-                self.reply("Bad User Input: may not specify 'off' with 'on' nor 'force'")
-                self.reply(helpString)
+                self.badInput("Bad User Input: may not specify 'off' with 'on' nor 'force'")
                 return
             for arg in args:
                 if arg == "focus":
@@ -130,24 +294,25 @@ class DuPontCollimator(Protocol):
                 elif arg == "force":
                     force = True
                 else:
-                    self.reply("Bad User Input: %s"%arg)
-                    self.reply(helpString)
+                    self.badInput("Bad User Input: %s"%arg)
                     return
             self.updateFocus(timer=timer, setFocus=setFocus, userCommanded=True, force=force)
 
         else:
-            self.reply("Bad User Input: %s"%userInput)
-            self.reply(helpString)
+            self.badInput("Bad User Input: %s"%userInput)
 
     def formatCollimationStr(self, collimationDict):
         collStrList = []
-        for key, value in collimationDict.iteritems():
+        for key, value in collimationDict.items():
             collStrList.append("%s=%.2f"%(key, value))
         return " ".join(collStrList)
 
-    def statusLines(self):
+    def zeropointLine(self):
         focusBaseStr = "None" if self.focusBase is None else "%.1f"%self.focusBase
         tempBaseStr = "None" if self.tempBase is None else "%.1f"%self.tempBase
+        return "[Focus, Temp] zeropoint: [%s, %s]"%(focusBaseStr, tempBaseStr)
+
+    def statusLines(self):
         afStr = OFF if self.autofocus==OFF else "%.2f seconds"%focusInterval
         collTargUpdate = self.getTargetCollimationUpdate()
         collCurrUpdate = self.getCurrentCollimationUpdate()
@@ -155,7 +320,7 @@ class DuPontCollimator(Protocol):
         deltaCurrColl = self.getDeltaCollimation(collCurrUpdate)
 
         statusLines = [
-            "[Focus, Temp] zeropoint: [%s, %s]"%(focusBaseStr, tempBaseStr),
+            self.zeropointLine(),
             "Autofocus updates: %s"%afStr,
             "Collimation absolute values:",
             "--Target: %s"%self.formatCollimationStr(collTargUpdate),
@@ -166,16 +331,51 @@ class DuPontCollimator(Protocol):
         ]
         return statusLines
 
+    def statusDict(self):
+        # numeric status for the json protocol, collimation
+        # values are None if tcs or M2 data are missing
+        collTargUpdate = self.getTargetCollimationUpdate() if self.hasTargetPosition() else None
+        collCurrUpdate = self.getCurrentCollimationUpdate() if self.hasCurrentPosition() else None
+        deltaTargColl = None
+        deltaCurrColl = None
+        if self.hasOrientation():
+            if collTargUpdate is not None:
+                deltaTargColl = self.getDeltaCollimation(collTargUpdate)
+            if collCurrUpdate is not None:
+                deltaCurrColl = self.getDeltaCollimation(collCurrUpdate)
+        return collections.OrderedDict((
+            ("focusBase", self.focusBase),
+            ("tempBase", self.tempBase),
+            ("autofocus", self.autofocus == ON),
+            ("focusInterval", focusInterval),
+            ("collimation", collections.OrderedDict((
+                ("target", collTargUpdate),
+                ("current", collCurrUpdate),
+            ))),
+            ("deltaCollimation", collections.OrderedDict((
+                ("target", deltaTargColl),
+                ("current", deltaCurrColl),
+            ))),
+            ("tcs", self.tcsDevice.statusDict()),
+            ("m2", self.m2Device.statusDict()),
+        ))
+
     def updateCollimation(self, force=False, target=False):
+        self.setData("moved", False)
+        if not (self.hasTargetPosition() if target else self.hasCurrentPosition()) or not self.hasOrientation():
+            self.reply("Cannot collimate, missing tcs or M2 data, are they connected?", MissingData)
+            return
         if target:
             # check that HA is within 5 hours
             if numpy.abs(self.tcsDevice.targetHA)/15. > 5:
-                self.reply("Target HA > 5hrs!!!! Not allowed, enter a new ra")
+                self.reply("Target HA > 5hrs!!!! Not allowed, enter a new ra", NotAllowed)
                 return
             newColl = self.getTargetCollimationUpdate()
         else:
             newColl = self.getCurrentCollimationUpdate()
         deltaColl = self.getDeltaCollimation(newColl)
+        self.setData("collimation", newColl)
+        self.setData("deltaCollimation", deltaColl)
         if not force:
             # check limits before proceeding
             overMinTilt = numpy.max([numpy.abs(deltaColl["tip"]), numpy.abs(deltaColl["tilt"])]) > minTipTilt
@@ -183,17 +383,20 @@ class DuPontCollimator(Protocol):
             doMove = overMinTilt or overMinTrans
             if not doMove:
                 self.reply("Collimation offset too small for move:")
-                self.reply(self.formatCollimationStr(deltaColl))
+                if self.textMode:
+                    self.reply(self.formatCollimationStr(deltaColl))
                 return
         if not self.m2Device.isReady:
-            self.reply("M2 device not ready to collimate. State=%s Galil=%s"%(str(self.m2Device.state), str(self.m2Device.galil)))
+            self.reply("M2 device not ready to collimate. State=%s Galil=%s"%(str(self.m2Device.state), str(self.m2Device.galil)), NotReady)
             return
         # command the new collimation with current focus value
         currentFocus = self.m2Device.orientation[0]
         self.reply("Updating collimation: ")
-        self.reply(self.formatCollimationStr(newColl))
-        newFullOrientation = [currentFocus] + newColl.values()
+        if self.textMode:
+            self.reply(self.formatCollimationStr(newColl))
+        newFullOrientation = [currentFocus] + list(newColl.values())
         self.m2Device.move(newFullOrientation)
+        self.setData("moved", True)
 
     def updateFocus(self, timer=None, setFocus=None, userCommanded=False, force=False):
         # if userCommanded is True, focus was commanded by the user,
@@ -201,22 +404,34 @@ class DuPontCollimator(Protocol):
         # if userCommanded is False, this was triggered
         # by the timer so check for timer state before applying
         # focus update.
+        self.setData("moved", False)
         if setFocus:
             self.focusBase = self.m2Device.focus
             self.tempBase = self.tcsDevice.temp
-            self.reply("Setting baseFocus=%.2f baseTemmp=%.2f"%(self.focusBase, self.tcsDevice.temp))
+            self.setData("focusBase", self.focusBase)
+            self.setData("tempBase", self.tempBase)
+            if self.textMode:
+                self.reply("Setting baseFocus=%.2f baseTemmp=%.2f"%(self.focusBase, self.tcsDevice.temp))
+            else:
+                self.reply("Setting focus baseline")
         if timer == OFF:
             self.autofocus = OFF
             # stop the timer if active
-            self.focusTimer.stop()
+            if self.focusTimer.running:
+                self.focusTimer.stop()
+            self.setData("autofocus", False)
             self.reply("Stopping focus interval")
             # return not doing anything!
             return
         elif timer == ON:
             self.autofocus = ON
             # call this again after the interval has elapsed
-            self.reply("Starting focus interval %.2f seconds"%focusInterval)
+            if self.textMode:
+                self.reply("Starting focus interval %.2f seconds"%focusInterval)
+            else:
+                self.reply("Starting focus interval")
             self.focusTimer.start(focusInterval, now=False)
+            self.setData("autofocus", True)
 
         if not userCommanded and self.autofocus == OFF:
             # focus update was fired on a timer (not user commanded)
@@ -227,27 +442,33 @@ class DuPontCollimator(Protocol):
             self.focusTimer.stop()
             return
         if None in [self.focusBase, self.tempBase]:
-            self.reply("Cannot set focus without a baseline, please issue focus set (at a good focus)")
-            self.reply(self.statusLines()[0])
+            self.reply("Cannot set focus without a baseline, please issue focus set (at a good focus)", MissingData)
+            if self.textMode:
+                self.reply(self.zeropointLine())
             return
         elif None in [self.tcsDevice.temp, self.tcsDevice.elevation]:
-            self.reply("Cannot set focus, missing tcs Data, is it connected?")
+            self.reply("Cannot set focus, missing tcs Data, is it connected?", MissingData)
+            return
+        elif self.m2Device.focus is None:
+            self.reply("Cannot set focus, missing M2 Data, is it connected?", MissingData)
             return
         newFocusValue = getFocus(self.focusBase, self.tempBase, self.tcsDevice.temp, self.tcsDevice.elevation)
         deltaFocus = newFocusValue - self.m2Device.focus
+        self.setData("focus", newFocusValue)
+        self.setData("deltaFocus", deltaFocus)
         if numpy.abs(deltaFocus) < minFocusMove and not force:
-            self.reply("Focus offset %.2f too small to apply"%deltaFocus)
+            if self.textMode:
+                self.reply("Focus offset %.2f too small to apply"%deltaFocus)
+            else:
+                self.reply("Focus offset too small to apply")
             return
         if not self.m2Device.isReady:
-            self.reply("M2 device not ready to focus. State=%s Galil=%s"%(str(self.m2Device.state), str(self.m2Device.galil)))
+            self.reply("M2 device not ready to focus. State=%s Galil=%s"%(str(self.m2Device.state), str(self.m2Device.galil)), NotReady)
             return
-        self.reply("Updating focus to %.2f"%newFocusValue)
+        if self.textMode:
+            self.reply("Updating focus to %.2f"%newFocusValue)
+        else:
+            self.reply("Updating focus")
         self.m2Device.move([newFocusValue])
+        self.setData("moved", True)
 
-def getFactory(m2Device, tcsDevice):
-    # construct m2Device and tcsDevcie have
-    # active communication with the m2 and tcs
-    class DuPontCollimatorFactory(Factory):
-        def buildProtocol(self, addr):
-            return DuPontCollimator(m2Device, tcsDevice)
-    return DuPontCollimatorFactory
@@ -1,12 +1,11 @@
 from __future__ import division, absolute_import
 
+import collections
 import traceback
 import sys
+import time
 
-from twisted.internet import task
-from twisted.internet.protocol import Protocol, ClientFactory
-#http://twistedmatrix.com/documents/12.1.0/core/howto/clients.html
-
+from .baseDevice import BaseDevice
 from .config import statusRefreshRate
 
 Done = "Done"
@@ -18,12 +17,15 @@ Off = "off"
 validMotionStates = [Done, Moving, Failed, Error]
 validGalilStates = [On, Off]
 
-class M2Device(Protocol):
+class M2Device(BaseDevice):
 
     def __init__(self):
+        BaseDevice.__init__(self)
+        self.statusLoop = None
         self.state = None
         self.orientation = [None]*5
         self.galil = None
+        self.statusTimes = {} # time each status field was last received
 
     @property
     def focus(self):
@@ -33,9 +35,17 @@ class M2Device(Protocol):
     def isReady(self):
         # if moving or unknown, we're not ready
         # i think it's ok to move if galil is not off
-        return self.state != Moving or self.state is not None #\
+        return self.state != Moving and self.state is not None #\
             # and self.galil == Off or self.galil is not None
 
+    def statusDict(self):
+        """Return an OrderedDict of field: {"value": value, "time": unix time received}
+        """
+        return collections.OrderedDict(
+            (attr, {"value": getattr(self, attr), "time": self.statusTimes.get(attr)})
+            for attr in ["state", "orientation", "galil"]
+        )
+
     def move(self, valueList):
         """Command an absolute orientation move
 
@@ -58,10 +68,16 @@ class M2Device(Protocol):
     def galilOff(self):
         self.transport.write("galil off\r\n")
 
-    def connectionMade(self):
+    def connectionMade(self, transport):
+        self.transport = transport
         print("M2 connection made, starting status polling")
-        loop = task.LoopingCall(self.getStatus)
-        loop.start(statusRefreshRate)
+        self.statusLoop = transport.loopingCall(self.getStatus)
+        self.statusLoop.start(statusRefreshRate)
+
+    def connectionLost(self):
+        print("M2 connection lost, stopping status polling")
+        if self.statusLoop is not None and self.statusLoop.running:
+            self.statusLoop.stop()
 
     def getStatus(self):
         self.transport.write("status\r\n")
@@ -95,20 +111,16 @@ class M2Device(Protocol):
                         if self.state == Moving and val != Moving:
                             self.galilOff()
                         self.state = val
+                        self.statusTimes["state"] = time.time()
                     elif key == "ori":
                         key = "orientation"
                         self.orientation = [float(x) for x in val.split(",")]
                         assert len(self.orientation) == 5
+                        self.statusTimes["orientation"] = time.time()
                     elif key == "galil":
                         assert val in validGalilStates
                         self.galil = val
+                        self.statusTimes["galil"] = time.time()
         except:
             print("Error trying to parse M2 response: %s"%replyStr)
             traceback.print_exc(file=sys.stdout)
-
-class M2Fact(ClientFactory):
-    def buildProtocol(self, addr):
-        return M2Device()
-
-
-
@@ -3,13 +3,11 @@ from __future__ import division, absolute_import
 import collections
 import traceback
 import sys
+import time
 
 import numpy
 
-from twisted.internet import task
-from twisted.internet.protocol import Protocol, ClientFactory
-#http://twistedmatrix.com/documents/12.1.0/core/howto/clients.html
-
+from .baseDevice import BaseDevice
 from .config import statusRefreshRate
 
 Slewing = "Slewing"
@@ -58,13 +56,20 @@ statusFieldDict = collections.OrderedDict((
    ("state", castTelState), # important that state remains last in this list! for checking new slew
 ))
 
-class TCSDevice(Protocol):
+class TCSDevice(BaseDevice):
 
     def __init__(self, slewCallback = None):
         # initialize all status fields as
         # attributes on this class with value none
+        BaseDevice.__init__(self)
+        self.statusLoop = None
         self.statusCmdQueue = [] # this is populated by self.getStatus()
         self.slewCallback = slewCallback
+        # last received value and time of each status field,
+        # unlike the attributes these are not cleared each poll
+        self.lastValues = {}
+        self.statusTimes = {}
+        self.clearStatus()
 
     @property
     def dec(self):
@@ -100,10 +105,16 @@ class TCSDevice(Protocol):
     def isSlewing(self):
         return self.state == Slewing
 
-    def connectionMade(self):
+    def connectionMade(self, transport):
+        self.transport = transport
         print("TCS connection made, starting status polling")
-        loop = task.LoopingCall(self.getStatus)
-        loop.start(statusRefreshRate)
+        self.statusLoop = transport.loopingCall(self.getStatus)
+        self.statusLoop.start(statusRefreshRate)
+
+    def connectionLost(self):
+        print("TCS connection lost, stopping status polling")
+        if self.statusLoop is not None and self.statusLoop.running:
+            self.statusLoop.stop()
 
     def clearStatus(self):
         # set all status pieces to None,
@@ -112,6 +123,15 @@ class TCSDevice(Protocol):
         for attr in statusFieldDict.keys():
             setattr(self, attr, None)
 
+    def statusDict(self):
+        """Return an OrderedDict of field: {"value": value, "time": unix time received}
+        holding the last value received for each field
+        """
+        return collections.OrderedDict(
+            (attr, {"value": self.lastValues.get(attr), "time": self.statusTimes.get(attr)})
+            for attr in statusFieldDict.keys()
+        )
+
     def dataReceived(self, data):
         # called each time data is output from tcs
         try:
@@ -131,6 +151,8 @@ class TCSDevice(Protocol):
                 print("Slewing state detected")
                 self.slewCallback()
             setattr(self, currCmd, newValue)
+            self.lastValues[currCmd] = newValue
+            self.statusTimes[currCmd] = time.time()
         except:
             print("TCS could not parse %s for command %s"%(data, currCmd))
             traceback.print_exc(file=sys.stdout)
@@ -149,7 +171,7 @@ class TCSDevice(Protocol):
         # print("getStatus")
         # clear status to ensure we get a fresh one
         self.clearStatus()
-        self.statusCmdQueue = statusFieldDict.keys()
+        self.statusCmdQueue = list(statusFieldDict.keys())
         self.sendNextStatus()
 
     def addSlewCallback(self, slewCallback):
@@ -158,14 +180,3 @@ class TCSDevice(Protocol):
         """
         assert callable(slewCallback)
         self.slewCallback = slewCallback
-
-
-class TCSFact(ClientFactory):
-    def buildProtocol(self, addr):
-        return TCSDevice()
-
-
-
-
-
-
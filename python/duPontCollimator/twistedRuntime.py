@@ -0,0 +1,118 @@
+from __future__ import division, absolute_import
+
+from twisted.internet import reactor, defer, task
+from twisted.internet.protocol import ClientFactory, Factory
+from twisted.protocols.basic import LineReceiver
+from twisted.internet.endpoints import TCP4ClientEndpoint, TCP4ServerEndpoint
+#http://twistedmatrix.com/documents/12.1.0/core/howto/clients.html
+
+from . import config
+from .baseDevice import maxLineLength
+from .tcsDevice import TCSDevice
+from .m2Device import M2Device
+from .duPontCollimator import DuPontCollimator
+
+
+class TwistedTransport(LineReceiver):
+    """Connect a device (see baseDevice) to a twisted connection
+    """
+    delimiter = b"\n"
+    MAX_LENGTH = maxLineLength
+
+    def __init__(self, device):
+        self.device = device
+
+    def connectionMade(self):
+        self.device.connectionMade(self)
+
+    def connectionLost(self, reason):
+        self.device.connectionLost()
+
+    def lineReceived(self, line):
+        self.device.dataReceived(line.decode("utf-8", "replace"))
+
+    def lineLengthExceeded(self, line):
+        print("Line longer than %i bytes, dropping connection"%self.MAX_LENGTH)
+        return LineReceiver.lineLengthExceeded(self, line)
+
+    def write(self, string):
+        self.transport.write(string.encode("utf-8"))
+
+    def loopingCall(self, func):
+        return task.LoopingCall(func)
+
+
+class DeviceClientFactory(ClientFactory):
+    def __init__(self, deviceClass):
+        self.deviceClass = deviceClass
+
+    def buildProtocol(self, addr):
+        return TwistedTransport(self.deviceClass())
+
+
+class DuPontCollimatorFactory(Factory):
+    def __init__(self, tcsDevice, m2Device):
+        # tcsDevice and m2Device have
+        # active communication with the tcs and m2
+        self.tcsDevice = tcsDevice
+        self.m2Device = m2Device
+
+    def buildProtocol(self, addr):
+        return TwistedTransport(DuPontCollimator(self.tcsDevice, self.m2Device))
+
+
+def closeConnections(protocols):
+    # drop the device connections of an instance that failed to start
+    for protocol in protocols:
+        protocol.transport.loseConnection()
+
+def bothConnected(result, instance):
+    # result is [(success, m2Protocol), (success, tcsProtocol)]
+    failures = [value for (success, value) in result if not success]
+    if failures:
+        for failure in failures:
+            print("%s connection failure: %s"%(instance.name, failure.getErrorMessage()))
+        # drop the connection that did succeed
+        closeConnections([value for (success, value) in result if success])
+        return False
+    print("%s: both connections ok...starting server on port %i"%(instance.name, instance.userPort))
+    m2Proto = result[0][1]
+    tcsProto = result[1][1]
+    endpoint = TCP4ServerEndpoint(reactor, instance.userPort)
+    d = endpoint.listen(DuPontCollimatorFactory(tcsProto.device, m2Proto.device))
+    d.addCallbacks(lambda port: True, listenFailed, errbackArgs=(instance, [m2Proto, tcsProto]))
+    return d
+
+def listenFailed(failure, instance, protocols):
+    print("%s could not listen on port %i: %s"%(instance.name, instance.userPort, failure.getErrorMessage()))
+    closeConnections(protocols)
+    return False
+
+def startInstance(instance):
+    # begin connection to tcs
+    point = TCP4ClientEndpoint(reactor, instance.tcsHost, instance.tcsPort)
+    dTCS = point.connect(DeviceClientFactory(TCSDevice))
+
+    # begin connection to M2
+    point = TCP4ClientEndpoint(reactor, instance.m2Host, instance.m2Port)
+    dM2 = point.connect(DeviceClientFactory(M2Device))
+
+    # when both are connected
+    # construct the server
+    dl = defer.DeferredList([dM2, dTCS], consumeErrors=True)
+    dl.addCallback(bothConnected, instance)
+    return dl
+
+def allStarted(result):
+    # stop only if no instance could be started
+    if not any(started for (success, started) in result):
+        print("No instances started")
+        reactor.stop()
+
+def run(instances=config.instances):
+    """Start all instances and run the twisted reactor
+    """
+    config.checkInstances(instances)
+    dAll = defer.DeferredList([startInstance(inst) for inst in instances], consumeErrors=True)
+    dAll.addCallback(allStarted)
+    reactor.run()
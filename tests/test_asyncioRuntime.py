@@ -0,0 +1,161 @@
+from __future__ import division, absolute_import
+
+import asyncio
+
+from duPontCollimator.asyncioRuntime import AsyncioTransport, LoopingCall, InstanceHandle
+from duPontCollimator.baseDevice import BaseDevice, maxLineLength
+from duPontCollimator.tcsDevice import TCSDevice
+from duPontCollimator.m2Device import M2Device
+
+
+class FakeTransport(object):
+    # stands in for an asyncio transport
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
+class RecordingDevice(BaseDevice):
+    def __init__(self):
+        BaseDevice.__init__(self)
+        self.lines = []
+
+    def dataReceived(self, data):
+        self.lines.append(data)
+
+
+def connect(device):
+    protocol = AsyncioTransport(device)
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+def test_coalescedAndPartialLines():
+    device = RecordingDevice()
+    protocol = connect(device)
+    protocol.data_received(b"one\r\ntwo\r\nthr")
+    assert device.lines == ["one\r", "two\r"]
+    protocol.data_received(b"ee\r\n")
+    assert device.lines == ["one\r", "two\r", "three\r"]
+
+
+def test_splitUTF8():
+    device = RecordingDevice()
+    protocol = connect(device)
+    data = u"été\n".encode("utf-8")
+    protocol.data_received(data[:1])
+    protocol.data_received(data[1:])
+    assert device.lines == [u"été"]
+
+
+def test_lineTooLong():
+    device = RecordingDevice()
+    protocol = connect(device)
+    protocol.data_received(b"x" * maxLineLength)
+    assert not protocol.transport.closed
+    protocol.data_received(b"x")
+    assert protocol.transport.closed
+    assert device.lines == []
+
+
+def test_writeEncodes():
+    protocol = connect(RecordingDevice())
+    protocol.write(u"status\r\n")
+    assert protocol.transport.written == [b"status\r\n"]
+
+
+def test_loopingCall():
+    calls = []
+
+    async def main():
+        loop = LoopingCall(lambda: calls.append("now"))
+        loop.start(0.01)
+        assert calls == ["now"]
+        await asyncio.sleep(0.035)
+        loop.stop()
+        nCalls = len(calls)
+        assert nCalls >= 3
+        await asyncio.sleep(0.03)
+        assert len(calls) == nCalls
+        assert not loop.running
+
+        later = LoopingCall(lambda: calls.append("later"))
+        later.start(0.01, now=False)
+        assert "later" not in calls
+        await asyncio.sleep(0.015)
+        later.stop()
+        assert calls.count("later") == 1
+
+    asyncio.run(main())
+
+
+def test_loopingCallStopsOnError():
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    async def main():
+        loop = LoopingCall(fail)
+        loop.start(0.01)
+        assert not loop.running
+        await asyncio.sleep(0.03)
+        assert calls == [1]
+
+    asyncio.run(main())
+
+
+def test_tcsQuerySequence():
+    async def main():
+        tcs = TCSDevice()
+        protocol = connect(tcs)
+        # polling starts on connection, the first query is sent
+        assert protocol.transport.written == [b"inpra\r\n"]
+        # two replies arrive in one read
+        protocol.data_received(b"01:00:00\r\n-30:00:00\r\n")
+        assert protocol.transport.written[1:] == [b"inpdc\r\n", b"st\r\n"]
+        assert tcs.inpra == 15.0
+        assert tcs.inpdc == -30.0
+        assert tcs.statusCmdQueue == ["st", "pos", "ttruss", "telel", "state"]
+        protocol.data_received(b"02:00:00\r\n0.1 -0.5\r\n10.0\r\n60.0\r\n0\r\n")
+        assert tcs.statusCmdQueue == []
+        assert tcs.temp == 10.0
+        assert tcs.elevation == 60.0
+        assert not tcs.isSlewing
+        protocol.connection_lost(None)
+        assert not tcs.statusLoop.running
+
+    asyncio.run(main())
+
+
+def test_instanceHandleClose():
+    class FakeServer(object):
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    async def main():
+        m2Protocol = connect(M2Device())
+        tcsProtocol = connect(TCSDevice())
+        handle = InstanceHandle(None, m2Protocol, tcsProtocol)
+        handle.server = FakeServer()
+        userProtocol = handle.buildUserProtocol()
+        userProtocol.connection_made(FakeTransport())
+        handle.close()
+        assert handle.server.closed
+        assert m2Protocol.transport.closed
+        assert tcsProtocol.transport.closed
+        assert userProtocol.transport.closed
+
+    asyncio.run(main())
@@ -0,0 +1,208 @@
+from __future__ import division, absolute_import
+
+import json
+
+import pytest
+
+from duPontCollimator import duPontCollimator
+from duPontCollimator.duPontCollimator import DuPontCollimator
+from duPontCollimator.tcsDevice import TCSDevice
+from duPontCollimator.m2Device import M2Device
+
+tcsReplies = {
+    "inpra": "01:00:00",
+    "inpdc": "-30:00:00",
+    "st": "02:00:00",
+    "pos": "0.1 -0.5",
+    "ttruss": "10.0",
+    "telel": "60.0",
+    "state": "0",
+}
+
+m2Status = "State=DONE Ori=12500.0,0.0,0.0,0.0,0.0 Lamps=off Galil=off"
+
+
+class StubLoopingCall(object):
+    def __init__(self, func):
+        self.func = func
+        self.running = False
+
+    def start(self, interval, now=True):
+        assert not self.running
+        self.running = True
+
+    def stop(self):
+        assert self.running
+        self.running = False
+
+
+class StubTransport(object):
+    def __init__(self):
+        self.written = []
+        self.loops = []
+
+    def write(self, string):
+        self.written.append(string)
+
+    def loopingCall(self, func):
+        loop = StubLoopingCall(func)
+        self.loops.append(loop)
+        return loop
+
+
+def pollTCS(tcs):
+    # run one full status poll
+    tcs.getStatus()
+    for cmd in list(tcs.statusCmdQueue):
+        tcs.dataReceived(tcsReplies[cmd] + "\r")
+
+
+@pytest.fixture
+def devices():
+    tcs = TCSDevice()
+    tcs.connectionMade(StubTransport())
+    m2 = M2Device()
+    m2.connectionMade(StubTransport())
+    coll = DuPontCollimator(tcs, m2)
+    coll.connectionMade(StubTransport())
+    return coll, tcs, m2
+
+
+@pytest.fixture
+def collimator(devices):
+    # a collimator in json mode with tcs and m2 status
+    coll, tcs, m2 = devices
+    pollTCS(tcs)
+    m2.dataReceived(m2Status)
+    coll.dataReceived("json")
+    return devices
+
+
+def send(coll, line):
+    # send a line, return the decoded json responses
+    coll.transport.written = []
+    coll.dataReceived(line)
+    return [json.loads(out) for out in coll.transport.written]
+
+
+def test_switchModes(devices):
+    coll, tcs, m2 = devices
+    assert not coll.jsonMode
+    coll.dataReceived("json")
+    assert coll.jsonMode
+    response, = send(coll, '{"id": 1, "cmd": "text"}')
+    assert response["id"] == 1
+    assert response["code"] == duPontCollimator.OK
+    assert not coll.jsonMode
+    coll.transport.written = []
+    coll.dataReceived("help")
+    assert coll.transport.written == [duPontCollimator.helpString.strip() + "\n"]
+
+
+def test_batch(collimator):
+    coll, tcs, m2 = collimator
+    responses, = send(coll, '[{"id": "a", "cmd": "status"}, {"id": "b", "cmd": "bogus"}]')
+    assert [resp["id"] for resp in responses] == ["a", "b"]
+    assert responses[0]["code"] == duPontCollimator.OK
+    assert responses[0]["data"]["tcs"]["ttruss"]["value"] == 10.0
+    assert responses[0]["data"]["m2"]["orientation"]["value"] == [12500.0, 0.0, 0.0, 0.0, 0.0]
+    assert responses[1]["code"] == duPontCollimator.BadCommand
+
+
+def test_badJSON(collimator):
+    coll, tcs, m2 = collimator
+    response, = send(coll, "not json")
+    assert response["id"] is None
+    assert response["code"] == duPontCollimator.BadJSON
+    response, = send(coll, '{"id": 2, "cmd": 7}')
+    assert response["id"] == 2
+    assert response["code"] == duPontCollimator.BadJSON
+
+
+def test_badCommand(collimator):
+    coll, tcs, m2 = collimator
+    response, = send(coll, '{"id": 3, "cmd": "collimate sideways"}')
+    assert response["id"] == 3
+    assert response["code"] == duPontCollimator.BadCommand
+    assert response["messages"] == ["Bad User Input: sideways"]
+
+
+def test_statusMissingData(devices):
+    coll, tcs, m2 = devices
+    coll.dataReceived("json")
+    # before any tcs or m2 status
+    response, = send(coll, '{"id": 4, "cmd": "status"}')
+    assert response["code"] == duPontCollimator.MissingData
+    assert response["data"]["collimation"] == {"target": None, "current": None}
+    assert response["data"]["m2"]["state"]["value"] is None
+    # m2 known, tcs poll in flight
+    m2.dataReceived(m2Status)
+    pollTCS(tcs)
+    tcs.getStatus()
+    tcs.dataReceived(tcsReplies["inpra"])
+    response, = send(coll, '{"id": 5, "cmd": "status"}')
+    assert response["code"] == duPontCollimator.MissingData
+    assert response["data"]["m2"]["state"]["value"] == "Done"
+    # the last received tcs values are kept
+    assert response["data"]["tcs"]["pos"]["value"] is not None
+    assert response["data"]["tcs"]["pos"]["time"] is not None
+
+
+def test_collimateMoved(collimator):
+    coll, tcs, m2 = collimator
+    response, = send(coll, '{"id": 6, "cmd": "collimate force"}')
+    assert response["code"] == duPontCollimator.OK
+    assert response["data"]["moved"] is True
+    assert response["messages"] == ["Updating collimation:"]
+    newColl = response["data"]["collimation"]
+    assert m2.transport.written[-1].startswith("move 12500.00")
+    # mirror now at the model collimation, too small to move
+    m2.dataReceived("State=DONE Ori=12500.0,%(tip)f,%(tilt)f,%(X)f,%(Y)f Lamps=off Galil=off"%newColl)
+    response, = send(coll, '{"id": 7, "cmd": "collimate"}')
+    assert response["code"] == duPontCollimator.OK
+    assert response["data"]["moved"] is False
+    assert abs(response["data"]["deltaCollimation"]["X"]) < 0.01
+
+
+def test_collimateNotReady(collimator):
+    coll, tcs, m2 = collimator
+    m2.dataReceived("State=MOVING")
+    response, = send(coll, '{"id": 8, "cmd": "collimate force"}')
+    assert response["code"] == duPontCollimator.NotReady
+    assert response["data"]["moved"] is False
+
+
+def test_focusMoved(collimator):
+    coll, tcs, m2 = collimator
+    response, = send(coll, '{"id": 9, "cmd": "focus"}')
+    assert response["code"] == duPontCollimator.MissingData
+    response, = send(coll, '{"id": 10, "cmd": "focus set"}')
+    assert response["code"] == duPontCollimator.OK
+    assert response["data"]["moved"] is False
+    assert response["data"]["focusBase"] == 12500.0
+    assert response["data"]["deltaFocus"] == 0.0
+    response, = send(coll, '{"id": 11, "cmd": "focus force"}')
+    assert response["data"]["moved"] is True
+    assert response["data"]["focus"] == 12500.0
+    assert m2.transport.written[-1] == "move 12500.00\r\n"
+
+
+def test_autofocusUnsolicited(collimator):
+    coll, tcs, m2 = collimator
+    send(coll, '{"id": 12, "cmd": "focus set"}')
+    response, = send(coll, '{"id": 13, "cmd": "focus on"}')
+    assert response["data"]["autofocus"] is True
+    focusTimer = coll.transport.loops[-1]
+    assert focusTimer.running
+    # the truss cooled, the timer fires
+    tcsReplies["ttruss"], ttruss = "9.0", tcsReplies["ttruss"]
+    try:
+        pollTCS(tcs)
+    finally:
+        tcsReplies["ttruss"] = ttruss
+    coll.transport.written = []
+    focusTimer.func()
+    response, = [json.loads(out) for out in coll.transport.written]
+    assert response["id"] is None
+    assert response["data"]["moved"] is True
+    assert response["data"]["deltaFocus"] == duPontCollimator.getFocus(12500.0, 10.0, 9.0, 60.0) - 12500.0